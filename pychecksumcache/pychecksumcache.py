@@ -1,11 +1,429 @@
+import fnmatch
 import hashlib
+import logging
+import mmap
 import os
 import json
 import shutil
+import stat
 import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, suppress
 from pathlib import Path
-from typing import Callable, Dict, List, Union, Optional, Tuple, Any
-from loguru import logger
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+logger = logging.getLogger(__name__)
+
+# Version of the on-disk cache layout, bumped whenever the format changes
+CACHE_VERSION = 2
+SUPPORTED_ALGORITHMS = ("md5", "sha256", "blake3", "xxh3_64")
+
+# Read size used when a file has to be hashed chunk by chunk
+_READ_CHUNK = 1 << 20
+
+# Per-thread read buffers, so chunked reads don't allocate a buffer per file
+_thread_buffers = threading.local()
+
+# Bytes requested per call when the kernel copies file data
+_KERNEL_COPY_CHUNK = 1 << 30
+
+# Files at least this large are memory-mapped and hashed without copying
+_MMAP_THRESHOLD = 1 << 20
+
+# Files smaller than this are hashed from a single read call
+_SMALL_FILE_SIZE = 64 * 1024
+
+# Flags opening files to hash them, O_BINARY avoids newline translation on Windows
+# and O_NONBLOCK keeps opening a FIFO from blocking before it can be rejected
+_OPEN_FLAGS = os.O_RDONLY | getattr(os, "O_BINARY", 0) | getattr(os, "O_NONBLOCK", 0)
+
+# Cache entries encoded per chunk when streaming the cache file to disk
+_SAVE_CHUNK_ENTRIES = 4096
+
+# Number of normalized paths memoized per cache instance
+_PATH_CACHE_SIZE = 4096
+
+# Number of parsed cache files kept for reuse by other instances of the process
+_SHARED_STATES_SIZE = 8
+
+# Shared pool for hashing batches of files, hashlib releases the GIL while hashing
+_HASH_WORKERS = os.cpu_count() or 1
+_HASH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=_HASH_WORKERS, thread_name_prefix="pychecksumcache"
+)
+
+# Batches are split in about this many slices per worker, one task per slice
+_SLICES_PER_WORKER = 4
+
+
+class CacheEntry(NamedTuple):
+    """Raw checksum of a file along with the stat metadata it was computed from."""
+
+    size: int
+    mtime_ns: int
+    digest: bytes
+
+
+def _decode_entry(value: Any) -> Optional[CacheEntry]:
+    """Build a cache entry from its JSON form, None if it's malformed."""
+    try:
+        if isinstance(value, str):
+            # Digest-only entry from an older cache, the next check will rehash it
+            return CacheEntry(-1, -1, bytes.fromhex(value))
+        return CacheEntry(
+            int(value["size"]), int(value["mtime_ns"]), bytes.fromhex(value["digest"])
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _encode_entry(entry: CacheEntry) -> Dict[str, Any]:
+    """Get the JSON form of a cache entry, with a hexadecimal digest."""
+    return {
+        "size": entry.size,
+        "mtime_ns": entry.mtime_ns,
+        "digest": entry.digest.hex(),
+    }
+
+
+class AggregateEntry(NamedTuple):
+    """Combined digest of the inputs of an aggregate, with the stat of the file built."""
+
+    inputs: bytes
+    size: int
+    mtime_ns: int
+
+
+def _decode_aggregate(value: Any) -> Optional[AggregateEntry]:
+    """Build an aggregate entry from its JSON form, None if it's malformed."""
+    try:
+        # The output stat is unknown for entries that only recorded the inputs
+        return AggregateEntry(
+            bytes.fromhex(value["inputs"]),
+            int(value.get("size", -1)),
+            int(value.get("mtime_ns", -1)),
+        )
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _encode_aggregate(entry: AggregateEntry) -> Dict[str, Any]:
+    """Get the JSON form of an aggregate entry, with a hexadecimal digest."""
+    return {
+        "inputs": entry.inputs.hex(),
+        "size": entry.size,
+        "mtime_ns": entry.mtime_ns,
+    }
+
+
+def _inputs_digest(
+    input_keys: List[str], entries: Mapping[str, Optional[CacheEntry]]
+) -> bytes:
+    """
+    Combine the digests of the inputs of an aggregate, in order, into one key.
+
+    Only the per-file digests and cache keys are hashed, never the contents.
+
+    Args:
+        input_keys: Cache keys of the inputs, in aggregation order
+        entries: Cache entries by cache key, missing or None for absent inputs
+
+    Returns:
+        The combined digest as bytes
+    """
+    combined = hashlib.blake2b(digest_size=16)
+    for cache_key in input_keys:
+        entry = entries.get(cache_key)
+        digest = entry.digest if entry is not None else b""
+        combined.update(b"%d:%s\0" % (len(digest), cache_key.encode()))
+        combined.update(digest)
+    return combined.digest()
+
+
+def _stat_or_none(path: Union[str, Path]) -> Optional[os.stat_result]:
+    """Stat a file, None if it doesn't exist."""
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def _stat_key(st: os.stat_result) -> Tuple[int, int, int, int]:
+    """Identify a version of a file by its inode and stat metadata."""
+    # A file replaced by another one of the same size and mtime has another inode
+    return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class _CacheState(NamedTuple):
+    """Parsed content of a cache file, with the stat metadata of the file it came from."""
+
+    stat_key: Tuple[int, int, int, int]
+    algorithm: Optional[str]
+    checksums: Dict[str, CacheEntry]
+    aggregates: Dict[str, AggregateEntry]
+
+
+def _parse_cache(data: Any, stat_key: Tuple[int, int, int, int]) -> _CacheState:
+    """
+    Build the cache state from a decoded cache document.
+
+    Args:
+        data: The decoded JSON document
+        stat_key: (st_dev, st_ino, mtime_ns, size) of the cache file
+
+    Returns:
+        The parsed state, with no algorithm and no entries if the document is malformed
+        or written in a newer layout
+    """
+    if not isinstance(data, dict):
+        return _CacheState(stat_key, None, {}, {})
+
+    if isinstance(data.get("version"), int) and "checksums" in data:
+        if data["version"] > CACHE_VERSION:
+            # Written in a newer layout this version can't read, start over
+            return _CacheState(stat_key, None, {}, {})
+        algorithm = data.get("algorithm")
+        checksums = data["checksums"]
+        # Not present in caches written before aggregates were tracked
+        aggregates = data.get("aggregates")
+    else:
+        # Legacy cache: a flat mapping of paths to MD5 digests
+        algorithm = "md5"
+        checksums = data
+        aggregates = None
+
+    if not isinstance(checksums, dict):
+        return _CacheState(stat_key, None, {}, {})
+
+    state = _CacheState(stat_key, algorithm, {}, {})
+    for cache_key, value in checksums.items():
+        entry = _decode_entry(value)
+        if entry is not None:
+            state.checksums[cache_key] = entry
+
+    if isinstance(aggregates, dict):
+        for cache_key, value in aggregates.items():
+            aggregate = _decode_aggregate(value)
+            if aggregate is not None:
+                state.aggregates[cache_key] = aggregate
+    return state
+
+
+def _scan_dir(path: str, key_prefix: str) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    Recursively list the regular files of a directory with their stat metadata.
+
+    Args:
+        path: Directory to scan
+        key_prefix: Prefix of the yielded paths, matching how cache keys are written
+
+    Yields:
+        Tuples of (path, stat_result), symlinks are not followed
+    """
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _scan_dir(entry.path, key_prefix + entry.name + os.sep)
+            elif entry.is_file(follow_symlinks=False):
+                yield key_prefix + entry.name, entry.stat(follow_symlinks=False)
+
+
+def _create_temp_file(path: Path) -> Tuple[int, str]:
+    """
+    Create a temporary file with a unique name next to a file, like tempfile.mkstemp.
+
+    Unlike mkstemp, which makes the file private, the file is created with the
+    mode open() gives a new file, 0o666 masked by the umask.
+
+    Args:
+        path: The file the temporary file will replace
+
+    Returns:
+        Tuple of (file descriptor open for writing, path of the temporary file)
+    """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    while True:
+        tmp_path = f"{path}.{os.urandom(6).hex()}.tmp"
+        try:
+            return os.open(tmp_path, flags, 0o666), tmp_path
+        except FileExistsError:
+            continue
+
+
+def _read_buffer() -> Tuple[bytearray, memoryview]:
+    """Return the reusable read buffer of the current thread and a view over it."""
+    try:
+        return _thread_buffers.buffer
+    except AttributeError:
+        buffer = bytearray(_READ_CHUNK)
+        _thread_buffers.buffer = (buffer, memoryview(buffer))
+        return _thread_buffers.buffer
+
+
+def _read_small(fd: int, size: int) -> bytes:
+    """
+    Read a small file to its end, usually in a single read call.
+
+    Args:
+        fd: Descriptor of the file, positioned at its start
+        size: Size of the file from a stat just taken
+
+    Returns:
+        The content of the file, including data appended since the stat
+    """
+    # Asking for one more byte than the size detects EOF, but a read may return
+    # less than requested, so keep reading until the extra byte or EOF arrives
+    chunks = []
+    remaining = size + 1
+    while remaining > 0 and (data := os.read(fd, remaining)):
+        chunks.append(data)
+        remaining -= len(data)
+    if remaining <= 0:
+        # The file grew since the stat, read it to the end
+        while data := os.read(fd, _READ_CHUNK):
+            chunks.append(data)
+    return b"".join(chunks)
+
+
+def _kernel_copy(in_fd: int, out_fd: int) -> None:
+    """
+    Copy file data between descriptors in-kernel, raising OSError if unsupported.
+
+    Data is copied from the current position of in_fd to its end, and written
+    at the current position of out_fd.
+    """
+    in_start = os.lseek(in_fd, 0, os.SEEK_CUR)
+    out_start = os.lseek(out_fd, 0, os.SEEK_CUR)
+    if hasattr(os, "copy_file_range"):
+        try:
+            while os.copy_file_range(in_fd, out_fd, _KERNEL_COPY_CHUNK):
+                pass
+            return
+        except OSError:
+            # Cross-filesystem copies aren't supported by older kernels
+            os.lseek(in_fd, in_start, os.SEEK_SET)
+            os.lseek(out_fd, out_start, os.SEEK_SET)
+
+    if not hasattr(os, "sendfile"):
+        raise OSError("No in-kernel copy available")
+    offset = in_start
+    while sent := os.sendfile(out_fd, in_fd, offset, _KERNEL_COPY_CHUNK):
+        offset += sent
+
+
+def _check_not_same_file(
+    src_stat: os.stat_result, src: Union[str, Path], dst: Union[str, Path]
+) -> None:
+    """Raise shutil.SameFileError like shutil.copy2 if dst is the source file."""
+    dst_stat = _stat_or_none(dst)
+    if dst_stat is not None and os.path.samestat(src_stat, dst_stat):
+        raise shutil.SameFileError(f"{str(src)!r} and {str(dst)!r} are the same file")
+
+
+def _fast_copy(src: str, dst: str) -> None:
+    """Copy a file and its metadata like shutil.copy2, keeping the data in-kernel."""
+    with open(src, "rb") as fsrc:
+        # Opening dst for writing would truncate the source
+        _check_not_same_file(os.fstat(fsrc.fileno()), src, dst)
+        with open(dst, "wb") as fdst:
+            try:
+                _kernel_copy(fsrc.fileno(), fdst.fileno())
+            except OSError:
+                # Start over with a plain userspace copy
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+                shutil.copyfileobj(fsrc, fdst, _READ_CHUNK)
+    shutil.copystat(src, dst)
+
+
+def _default_aggregate(
+    input_paths: List[str],
+    output_path: str,
+    hashers: Optional[Dict[str, Any]] = None,
+) -> Dict[str, os.stat_result]:
+    """
+    Concatenate the input files into the output, each under a name header.
+
+    Args:
+        input_paths: Paths of the files to concatenate
+        output_path: Path of the aggregate file
+        hashers: Optional hash objects by input path, fed with the content of
+                 those inputs as they are copied
+
+    Returns:
+        The stat of each hashed input, taken on the file that was read
+    """
+    # Inputs listed several times are only hashed on their first copy
+    pending = dict(hashers or {})
+    stats = {}
+
+    # Headers and small files accumulate in the buffer and reach the disk in
+    # large writes, bigger files are copied in-kernel after flushing it
+    with open(output_path, "wb", buffering=_READ_CHUNK) as outfile:
+        out_fd = outfile.fileno()
+        for input_path in input_paths:
+            with open(input_path, "rb", buffering=0) as infile:
+                outfile.write(b"--- %s ---\n" % os.path.basename(input_path).encode())
+                hasher = pending.pop(input_path, None)
+                st = os.fstat(infile.fileno())
+                if hasher is not None:
+                    stats[input_path] = st
+
+                if st.st_size < _SMALL_FILE_SIZE:
+                    # Read the content once, for both the hash and the output
+                    data = _read_small(infile.fileno(), st.st_size)
+                    if hasher is not None:
+                        hasher.update(data)
+                    outfile.write(data)
+                elif hasher is not None:
+                    buffer, view = _read_buffer()
+                    while size := infile.readinto(buffer):
+                        hasher.update(view[:size])
+                        outfile.write(view[:size])
+                else:
+                    outfile.flush()
+                    start = os.lseek(out_fd, 0, os.SEEK_CUR)
+                    try:
+                        _kernel_copy(infile.fileno(), out_fd)
+                    except OSError:
+                        infile.seek(0)
+                        outfile.seek(start)
+                        outfile.truncate()
+                        shutil.copyfileobj(infile, outfile, _READ_CHUNK)
+                outfile.write(b"\n\n")
+
+    return stats
 
 
 class PyChecksumCache:
@@ -14,10 +432,17 @@ class PyChecksumCache:
     Supports both synchronous and asynchronous operation, and handles both absolute and relative paths consistently.
     """
 
+    # Parsed cache files by absolute path, shared by all instances of the process,
+    # the least recently used ones are dropped past _SHARED_STATES_SIZE
+    _shared_states: "OrderedDict[str, _CacheState]" = OrderedDict()
+    _shared_states_lock = threading.Lock()
+
     def __init__(
         self,
         cache_file: Union[str, Path] = "checksum_cache.json",
         base_dir: Union[str, Path, None] = None,
+        algorithm: str = "md5",
+        pretty: bool = False,
     ):
         """
         Initialize the PyChecksumCache with a cache file to store checksums.
@@ -26,11 +451,74 @@ class PyChecksumCache:
             cache_file: Path to the JSON file that stores the checksums
             base_dir: Optional base directory for resolving relative paths.
                       If None, the current working directory is used.
+            algorithm: Hash algorithm used for checksums: "md5" (default), "sha256",
+                       "blake3" (requires the blake3 package) or "xxh3_64"
+                       (requires the xxhash package)
+            pretty: If True, write the cache file indented for readability
         """
+        if algorithm not in SUPPORTED_ALGORITHMS:
+            raise ValueError(
+                f"Unsupported algorithm: {algorithm}. "
+                f"Expected one of {', '.join(SUPPORTED_ALGORITHMS)}"
+            )
+        if algorithm == "blake3" and blake3 is None:
+            raise ValueError("The blake3 algorithm requires the blake3 package")
+        if algorithm == "xxh3_64" and xxhash is None:
+            raise ValueError("The xxh3_64 algorithm requires the xxhash package")
+
         self.cache_file = Path(cache_file)
         self.base_dir = Path(base_dir) if base_dir else Path.cwd()
-        self.checksums: Dict[str, str] = {}
-        self._load_cache()
+        self.algorithm = algorithm
+        self.pretty = pretty
+        # The cache file is only read when the checksums are first needed
+        self._checksums: Optional[Dict[str, CacheEntry]] = None
+        self._aggregates: Optional[Dict[str, AggregateEntry]] = None
+        self._load_lock = threading.Lock()
+        # Saves are deferred while a batch is open and flushed when it closes
+        self._defer_save = 0
+        self._dirty = False
+        self._path_cache: Dict[Union[str, Path], Path] = {}
+
+    @property
+    def checksums(self) -> Dict[str, CacheEntry]:
+        """Cache entries by cache key, loaded from the cache file on first access."""
+        if self._checksums is None:
+            self._ensure_loaded()
+            assert self._checksums is not None
+        return self._checksums
+
+    @checksums.setter
+    def checksums(self, value: Dict[str, CacheEntry]) -> None:
+        if self._aggregates is None:
+            # Replaced before loading, the cache file won't be read anymore
+            self._aggregates = {}
+        self._checksums = value
+
+    @property
+    def aggregates(self) -> Dict[str, AggregateEntry]:
+        """Inputs digest and stat of each aggregate file, by its cache key."""
+        if self._checksums is None:
+            self._ensure_loaded()
+        # Set before the checksums, whether by loading or by replacing them
+        assert self._aggregates is not None
+        return self._aggregates
+
+    def _ensure_loaded(self) -> None:
+        """Load the cache file once, even when first accessed from worker threads."""
+        with self._load_lock:
+            if self._checksums is None:
+                self._load_cache()
+
+    def _new_hasher(self) -> Any:
+        """Create a new hash object for the configured algorithm."""
+        if self.algorithm == "blake3":
+            # The package was checked to be available in __init__
+            assert blake3 is not None
+            return blake3.blake3()
+        if self.algorithm == "xxh3_64":
+            assert xxhash is not None
+            return xxhash.xxh3_64()
+        return hashlib.new(self.algorithm)
 
     def _normalize_path(self, file_path: Union[str, Path]) -> Path:
         """
@@ -42,10 +530,17 @@ class PyChecksumCache:
         Returns:
             An absolute Path object
         """
+        path = self._path_cache.get(file_path)
+        if path is not None:
+            return path
+
         path = Path(file_path)
         # if not path.is_absolute():
         #    path = (self.base_dir / path).resolve()
 
+        if len(self._path_cache) >= _PATH_CACHE_SIZE:
+            self._path_cache.clear()
+        self._path_cache[file_path] = path
         return path
 
     def _get_cache_key(self, file_path: Union[str, Path]) -> str:
@@ -63,133 +558,454 @@ class PyChecksumCache:
     def _load_cache(self) -> None:
         """Load MD5 checksums from the cache file if it exists."""
         cache_path = self._normalize_path(self.cache_file)
-        if cache_path.exists():
-            try:
-                with open(cache_path, "r") as f:
-                    self.checksums = json.load(f)
-            except (json.JSONDecodeError, IOError):
-                self.checksums = {}
-
-    def _save_cache(self) -> None:
-        """Save current checksums to the cache file."""
         try:
-            # Create directory if it doesn't exist
-            cache_path = self._normalize_path(self.cache_file)
-            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_path, "rb") as f:
+                # Reuse the state already parsed in this process if the file is the same
+                st = os.fstat(f.fileno())
+                state_key = os.path.abspath(cache_path)
+                stat_key = _stat_key(st)
+                state = self._get_shared_state(state_key)
+                if state is None or state.stat_key != stat_key:
+                    state = _parse_cache(self._loads(f.read()), stat_key)
+                    self._share_state(state_key, state)
+        except (ValueError, IOError):
+            # Also covers a missing file, orjson.JSONDecodeError and undecodable bytes
+            state = None
+
+        # Digests computed with another algorithm can't be compared, start over
+        if state is None or state.algorithm != self.algorithm:
+            self._aggregates = {}
+            self._checksums = {}
+            return
+
+        # Copied so the shared state doesn't change along with this instance. The
+        # checksums are set last, readers outside the lock wait for them
+        self._aggregates = dict(state.aggregates)
+        self._checksums = dict(state.checksums)
+
+    @classmethod
+    def _get_shared_state(cls, state_key: str) -> Optional[_CacheState]:
+        """Get the state last parsed or written for a cache file, if still kept."""
+        with cls._shared_states_lock:
+            state = cls._shared_states.get(state_key)
+            if state is not None:
+                cls._shared_states.move_to_end(state_key)
+            return state
+
+    @classmethod
+    def _share_state(cls, state_key: str, state: _CacheState) -> None:
+        """Keep the state of a cache file for reuse, evicting the oldest ones."""
+        with cls._shared_states_lock:
+            cls._shared_states[state_key] = state
+            cls._shared_states.move_to_end(state_key)
+            while len(cls._shared_states) > _SHARED_STATES_SIZE:
+                cls._shared_states.popitem(last=False)
+
+    def _cache_data(self) -> Dict[str, Any]:
+        """Build the JSON document persisted to the cache file."""
+        data = {
+            "version": CACHE_VERSION,
+            "algorithm": self.algorithm,
+            "checksums": {
+                cache_key: _encode_entry(entry)
+                for cache_key, entry in self.checksums.items()
+            },
+        }
+        if self.aggregates:
+            data["aggregates"] = self._aggregates_data()
+        return data
+
+    def _aggregates_data(self) -> Dict[str, Any]:
+        """Build the JSON form of the aggregates section, sorted by cache key."""
+        return {
+            cache_key: _encode_aggregate(self.aggregates[cache_key])
+            for cache_key in sorted(self.aggregates)
+        }
+
+    @staticmethod
+    def _loads(data: bytes) -> Any:
+        """Deserialize JSON bytes, with orjson when it is installed."""
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+    def _dumps(self, data: Any) -> bytes:
+        """Serialize data to JSON, with orjson when it is installed."""
+        if orjson is not None:
+            if self.pretty:
+                return orjson.dumps(
+                    data, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+                )
+            return orjson.dumps(data)
 
-            with open(cache_path, "w") as f:
-                json.dump(self.checksums, f, indent=2)
-        except IOError as e:
-            logger.warning(f"Warning: Failed to save checksum cache: {e}")
+        if self.pretty:
+            return json.dumps(data, indent=2, sort_keys=True).encode()
+        return json.dumps(data, separators=(",", ":")).encode()
 
-    async def _save_cache_async(self) -> None:
-        """Save current checksums to the cache file asynchronously."""
+    def _iter_cache_chunks(self) -> Iterator[bytes]:
+        """
+        Serialize the cache document piece by piece.
+
+        The compact layout is streamed a few thousand entries at a time so the
+        whole document is never held in memory; the pretty layout is encoded at once.
+        """
+        if self.pretty:
+            yield self._dumps(self._cache_data())
+            return
+
+        # Sorted keys give stable files, the entries are encoded in slices
+        keys = sorted(self.checksums)
+        yield b"{"
+        if self.aggregates:
+            # One entry per aggregate file, small enough to encode at once
+            yield b'"aggregates":' + self._dumps(self._aggregates_data()) + b","
+        yield b'"algorithm":' + self._dumps(self.algorithm) + b',"checksums":{'
+        for start in range(0, len(keys), _SAVE_CHUNK_ENTRIES):
+            entries = {
+                cache_key: _encode_entry(self.checksums[cache_key])
+                for cache_key in keys[start : start + _SAVE_CHUNK_ENTRIES]
+            }
+            if start:
+                yield b","
+            # Strip the braces so the slices join into a single object
+            yield self._dumps(entries)[1:-1]
+        yield b'},"version":' + str(CACHE_VERSION).encode() + b"}"
+
+    def _write_cache(self) -> None:
+        """Atomically write current checksums to the cache file."""
         try:
             # Create directory if it doesn't exist
             cache_path = self._normalize_path(self.cache_file)
             cache_path.parent.mkdir(parents=True, exist_ok=True)
 
-            # Use async file IO
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None,
-                lambda: open(cache_path, "w").write(
-                    json.dumps(self.checksums, indent=2)
+            # Write next to the cache and swap it in, so readers never see a partial
+            # file. The name is unique so concurrent writers don't share it
+            fd, tmp_path = _create_temp_file(cache_path)
+            try:
+                with open(fd, "wb", buffering=_READ_CHUNK) as f:
+                    # Keep the mode of the cache being replaced, a new one gets
+                    # the mode the umask gives
+                    previous = _stat_or_none(cache_path)
+                    if previous is not None:
+                        os.chmod(tmp_path, stat.S_IMODE(previous.st_mode))
+                    for chunk in self._iter_cache_chunks():
+                        f.write(chunk)
+                    # The data must be on disk before the rename, or a crash could
+                    # leave an empty cache file in place of the previous one
+                    f.flush()
+                    os.fsync(f.fileno())
+                    st = os.fstat(f.fileno())
+                os.replace(tmp_path, cache_path)
+            except BaseException:
+                with suppress(OSError):
+                    os.unlink(tmp_path)
+                raise
+
+            # Instances opening this cache next can skip parsing what was just written
+            self._share_state(
+                os.path.abspath(cache_path),
+                _CacheState(
+                    _stat_key(st),
+                    self.algorithm,
+                    dict(self.checksums),
+                    dict(self.aggregates),
                 ),
             )
         except IOError as e:
-            logger.warning(f"Warning: Failed to save checksum cache: {e}")
+            logger.warning("Failed to save checksum cache: %s", e)
+
+    def _save_cache(self) -> None:
+        """Save current checksums to the cache file, or defer it inside a batch."""
+        if self._defer_save:
+            self._dirty = True
+            return
+        self._write_cache()
+
+    async def _save_cache_async(self) -> None:
+        """Save current checksums to the cache file asynchronously."""
+        if self._defer_save:
+            self._dirty = True
+            return
+
+        # Run the blocking write in a worker thread
+        await asyncio.to_thread(self._write_cache)
+
+    def flush(self) -> None:
+        """Save pending cache changes to the cache file."""
+        if self._dirty:
+            self._dirty = False
+            self._write_cache()
+
+    async def flush_async(self) -> None:
+        """Save pending cache changes to the cache file asynchronously."""
+        if self._dirty:
+            self._dirty = False
+            await self._save_cache_async()
+
+    @contextmanager
+    def _batch(self) -> Iterator[None]:
+        """Coalesce all cache saves made inside the block into a single write."""
+        self._defer_save += 1
+        try:
+            yield
+        finally:
+            self._defer_save -= 1
+            if not self._defer_save:
+                self.flush()
+
+    @asynccontextmanager
+    async def _batch_async(self) -> AsyncIterator[None]:
+        """Coalesce all cache saves made inside the block into a single write."""
+        self._defer_save += 1
+        try:
+            yield
+        finally:
+            self._defer_save -= 1
+            if not self._defer_save:
+                await self.flush_async()
 
     def calculate_md5(self, file_path: Union[str, Path]) -> str:
         """
-        Calculate MD5 checksum for the given file.
+        Calculate the checksum for the given file using the configured algorithm.
 
         Args:
             file_path: Path to the file (absolute or relative)
 
         Returns:
-            MD5 hexadecimal digest of the file
+            Hexadecimal digest of the file (MD5 by default)
+        """
+        return self._file_digest(file_path).hex()
+
+    def _file_digest(self, file_path: Union[str, Path]) -> bytes:
         """
-        path = self._normalize_path(file_path)
-        if not path.exists() or not path.is_file():
-            raise FileNotFoundError(f"File not found: {path}")
+        Calculate the raw checksum for the given file.
+
+        Args:
+            file_path: Path to the file (absolute or relative)
 
-        md5 = hashlib.md5()
+        Returns:
+            Digest of the file as bytes
+        """
+        return self._file_digest_raw(self._normalize_path(file_path))
 
-        with open(path, "rb") as f:
-            # Read in chunks to handle large files efficiently
-            for chunk in iter(lambda: f.read(4096), b""):
-                md5.update(chunk)
+    def _file_digest_raw(
+        self, path: Union[str, Path], size: Optional[int] = None
+    ) -> bytes:
+        """
+        Calculate the raw checksum for an already normalized path, such as a cache key.
 
-        return md5.hexdigest()
+        Args:
+            path: Normalized path to the file
+            size: Size from a stat just taken and checked to be of a regular
+                  file, to skip the fstat
+
+        Returns:
+            Digest of the file as bytes
+        """
+        try:
+            fd = os.open(path, _OPEN_FLAGS)
+        except (FileNotFoundError, IsADirectoryError) as e:
+            raise FileNotFoundError(f"File not found: {path}") from e
+
+        try:
+            if size is None:
+                st = os.fstat(fd)
+                # Devices and FIFOs have no size to hash up to, like directories
+                if not stat.S_ISREG(st.st_mode):
+                    raise FileNotFoundError(f"File not found: {path}")
+                size = st.st_size
+            hasher = self._new_hasher()
+
+            if size < _SMALL_FILE_SIZE:
+                hasher.update(_read_small(fd, size))
+                return hasher.digest()
+
+            if size >= _MMAP_THRESHOLD:
+                try:
+                    # Hash straight from the page cache in a single call
+                    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+                        if hasattr(mmap, "MADV_SEQUENTIAL"):
+                            mm.madvise(mmap.MADV_SEQUENTIAL)
+                        hasher.update(mm)
+                    return hasher.digest()
+                except (ValueError, OSError):
+                    # Unmappable file, fall back to reading it
+                    pass
+
+            # The thread's buffer is reused, hashlib.file_digest would allocate one
+            with open(fd, "rb", buffering=0, closefd=False) as f:
+                buffer, view = _read_buffer()
+                while size := f.readinto(buffer):
+                    hasher.update(view[:size])
+                return hasher.digest()
+        finally:
+            os.close(fd)
 
     async def calculate_md5_async(self, file_path: Union[str, Path]) -> str:
         """
-        Calculate MD5 checksum for the given file asynchronously.
+        Calculate the checksum for the given file asynchronously.
 
         Args:
             file_path: Path to the file (absolute or relative)
 
         Returns:
-            MD5 hexadecimal digest of the file
+            Hexadecimal digest of the file (MD5 by default)
         """
-        path = self._normalize_path(file_path)
-        if not path.exists() or not path.is_file():
-            raise FileNotFoundError(f"File not found: {path}")
+        # Hash the whole file in a single worker thread call to avoid blocking
+        return await asyncio.to_thread(self.calculate_md5, file_path)
 
-        # Use async file IO to read the file
-        loop = asyncio.get_event_loop()
-        md5 = hashlib.md5()
+    def _check_file(
+        self, file_path: Union[str, Path], cache_key: str, use_stat: bool = True
+    ) -> Optional[CacheEntry]:
+        """
+        Build an up-to-date cache entry for a file.
 
-        # Open file in binary mode
-        file_size = os.path.getsize(path)
-        chunk_size = 4096
+        The file is only hashed when its size or modification time differs from
+        the cached entry, otherwise the cached entry is returned as is.
 
-        with open(path, "rb") as f:
-            for i in range(0, file_size, chunk_size):
-                # Run the file read in executor to avoid blocking
-                chunk = await loop.run_in_executor(
-                    None, lambda: f.read(min(chunk_size, file_size - i))
-                )
-                if not chunk:
-                    break
-                md5.update(chunk)
+        Args:
+            file_path: Path to the file (absolute or relative)
+            cache_key: The cache key of the file
+            use_stat: If False, always hash the file
 
-        return md5.hexdigest()
+        Returns:
+            The cache entry, or None if the file doesn't exist
+        """
+        return self._check_path(self._normalize_path(file_path), cache_key, use_stat)
 
-    def has_changed(self, file_path: Union[str, Path]) -> bool:
+    def _check_path(
+        self, path: Union[str, Path], cache_key: str, use_stat: bool = True
+    ) -> Optional[CacheEntry]:
         """
-        Check if the file has changed since the last check.
+        Build an up-to-date cache entry for an already normalized path.
 
         Args:
-            file_path: Path to the file to check (absolute or relative)
+            path: Normalized path to the file, such as a cache key
+            cache_key: The cache key of the file
+            use_stat: If False, always hash the file
 
         Returns:
-            True if the file is new or has changed, False otherwise
+            The cache entry, or None if the file doesn't exist
         """
-        cache_key = self._get_cache_key(file_path)
-
         try:
-            current_md5 = self.calculate_md5(file_path)
-            previous_md5 = self.checksums.get(cache_key)
+            st = os.stat(path)
+            if not stat.S_ISREG(st.st_mode):
+                return None
+
+            cached = self.checksums.get(cache_key)
+            if (
+                use_stat
+                and cached is not None
+                and cached.size == st.st_size
+                and cached.mtime_ns == st.st_mtime_ns
+            ):
+                return cached
+            digest = self._file_digest_raw(path, st.st_size)
+            return CacheEntry(st.st_size, st.st_mtime_ns, digest)
+        except FileNotFoundError:
+            return None
 
-            if previous_md5 is None or current_md5 != previous_md5:
-                self.checksums[cache_key] = current_md5
-                self._save_cache()
-                return True
+    def _hash_many(
+        self, file_list: Sequence[Union[str, Path]], use_stat: bool = True
+    ) -> Dict[str, Optional[CacheEntry]]:
+        """
+        Build up-to-date cache entries for several files in parallel.
 
-            return False
+        Args:
+            file_list: List of file paths to check (absolute or relative)
+            use_stat: If False, always hash the files
 
-        except FileNotFoundError:
-            # If file doesn't exist, remove it from cache
-            if cache_key in self.checksums:
-                del self.checksums[cache_key]
-                self._save_cache()
-            return False
+        Returns:
+            Mapping of cache keys to entries, None for files that don't exist
+        """
+        # Paths sharing the same cache key only need to be hashed once
+        unique_paths = {}
+        for file_path in file_list:
+            path = self._normalize_path(file_path)
+            unique_paths[str(path)] = path
+        return self._check_many(list(unique_paths.items()), use_stat)
+
+    def _check_many(
+        self, items: List[Tuple[str, Union[str, Path]]], use_stat: bool = True
+    ) -> Dict[str, Optional[CacheEntry]]:
+        """
+        Build up-to-date cache entries for normalized paths on the thread pool.
 
-    async def has_changed_async(self, file_path: Union[str, Path]) -> bool:
+        Files are handed to the workers in slices rather than one task per file,
+        so the task overhead doesn't dominate when checking many small files.
+
+        Args:
+            items: List of (cache_key, normalized path) tuples
+            use_stat: If False, always hash the files
+
+        Returns:
+            Mapping of cache keys to entries, None for files that don't exist
         """
-        Check if the file has changed since the last check asynchronously.
+        if len(items) <= 1:
+            # Nothing to overlap, skip the round trip through the pool
+            return self._check_slice(items, use_stat)
+
+        slice_size = max(1, len(items) // (_HASH_WORKERS * _SLICES_PER_WORKER))
+        futures = [
+            _HASH_EXECUTOR.submit(
+                self._check_slice, items[start : start + slice_size], use_stat
+            )
+            for start in range(0, len(items), slice_size)
+        ]
+
+        entries: Dict[str, Optional[CacheEntry]] = {}
+        for future in futures:
+            entries.update(future.result())
+        return entries
+
+    def _check_slice(
+        self, items: List[Tuple[str, Union[str, Path]]], use_stat: bool
+    ) -> Dict[str, Optional[CacheEntry]]:
+        """Build the cache entries of a slice of a batch, in a worker thread."""
+        return {
+            cache_key: self._check_path(path, cache_key, use_stat)
+            for cache_key, path in items
+        }
+
+    def _apply_checksums(
+        self, entries: Dict[str, Optional[CacheEntry]]
+    ) -> Dict[str, bool]:
+        """
+        Store fresh cache entries, saving the cache once if it was modified.
+
+        Args:
+            entries: Mapping of cache keys to entries, None for missing files
+
+        Returns:
+            Mapping of cache keys to True if the file is new or its content has changed
+        """
+        changed: Dict[str, bool] = {}
+        modified = False
+
+        for cache_key, entry in entries.items():
+            previous = self.checksums.get(cache_key)
+
+            if entry is None:
+                # If file doesn't exist, remove it from cache
+                changed[cache_key] = False
+                if previous is not None:
+                    del self.checksums[cache_key]
+                    modified = True
+                continue
+
+            changed[cache_key] = previous is None or entry.digest != previous.digest
+            if entry != previous:
+                # Also covers a touched but unchanged file, refresh its stat metadata
+                self.checksums[cache_key] = entry
+                modified = True
+
+        if modified:
+            self._save_cache()
+        return changed
+
+    def has_changed(self, file_path: Union[str, Path]) -> bool:
+        """
+        Check if the file has changed since the last check.
 
         Args:
             file_path: Path to the file to check (absolute or relative)
@@ -198,24 +1014,25 @@ class PyChecksumCache:
             True if the file is new or has changed, False otherwise
         """
         cache_key = self._get_cache_key(file_path)
+        entry = self._check_file(file_path, cache_key)
+        return self._apply_checksums({cache_key: entry})[cache_key]
 
-        try:
-            current_md5 = await self.calculate_md5_async(file_path)
-            previous_md5 = self.checksums.get(cache_key)
+    async def has_changed_async(self, file_path: Union[str, Path]) -> bool:
+        """
+        Check if the file has changed since the last check asynchronously.
 
-            if previous_md5 is None or current_md5 != previous_md5:
-                self.checksums[cache_key] = current_md5
-                await self._save_cache_async()
-                return True
+        Args:
+            file_path: Path to the file to check (absolute or relative)
 
-            return False
+        Returns:
+            True if the file is new or has changed, False otherwise
+        """
+        cache_key = self._get_cache_key(file_path)
+        entry = await asyncio.to_thread(self._check_file, file_path, cache_key)
 
-        except FileNotFoundError:
-            # If file doesn't exist, remove it from cache
-            if cache_key in self.checksums:
-                del self.checksums[cache_key]
-                await self._save_cache_async()
-            return False
+        # Let the batch save the cache asynchronously
+        async with self._batch_async():
+            return self._apply_checksums({cache_key: entry})[cache_key]
 
     def execute_if_changed(
         self, file_path: Union[str, Path], func: Callable, *args, **kwargs
@@ -253,9 +1070,8 @@ class PyChecksumCache:
             if asyncio.iscoroutinefunction(func):
                 return await func(*args, **kwargs)
             else:
-                # Run sync function in executor
-                loop = asyncio.get_event_loop()
-                return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+                # Run sync function in a worker thread
+                return await asyncio.to_thread(func, *args, **kwargs)
         return None
 
     def any_changed(self, file_list: List[Union[str, Path]]) -> bool:
@@ -268,7 +1084,10 @@ class PyChecksumCache:
         Returns:
             True if any file has changed, False otherwise
         """
-        return any(self.has_changed(file_path) for file_path in file_list)
+        if not file_list:
+            return False
+        with self._batch():
+            return any(self._apply_checksums(self._hash_many(file_list)).values())
 
     async def any_changed_async(self, file_list: List[Union[str, Path]]) -> bool:
         """
@@ -280,12 +1099,24 @@ class PyChecksumCache:
         Returns:
             True if any file has changed, False otherwise
         """
-        # Create tasks for all files
-        tasks = [self.has_changed_async(file_path) for file_path in file_list]
-        # Wait for all tasks to complete
-        results = await asyncio.gather(*tasks)
-        # Return True if any file changed
-        return any(results)
+        # Save the cache once at the end, whichever way the checks finish
+        async with self._batch_async():
+            # Create tasks for all files
+            tasks = [
+                asyncio.ensure_future(self.has_changed_async(file_path))
+                for file_path in file_list
+            ]
+            try:
+                # Return True as soon as one file has changed
+                for next_result in asyncio.as_completed(tasks):
+                    if await next_result:
+                        return True
+                return False
+            finally:
+                # Checks that haven't completed are dropped and leave the cache as is
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
 
     def all_changed(self, file_list: List[Union[str, Path]]) -> bool:
         """
@@ -297,7 +1128,10 @@ class PyChecksumCache:
         Returns:
             True if all files have changed, False otherwise
         """
-        return all(self.has_changed(file_path) for file_path in file_list)
+        if not file_list:
+            return True
+        with self._batch():
+            return all(self._apply_checksums(self._hash_many(file_list)).values())
 
     async def all_changed_async(self, file_list: List[Union[str, Path]]) -> bool:
         """
@@ -309,12 +1143,68 @@ class PyChecksumCache:
         Returns:
             True if all files have changed, False otherwise
         """
-        # Create tasks for all files
-        tasks = [self.has_changed_async(file_path) for file_path in file_list]
-        # Wait for all tasks to complete
-        results = await asyncio.gather(*tasks)
-        # Return True if all files changed
-        return all(results)
+        if not file_list:
+            return True
+        # Hash the whole batch in a single worker thread job on the shared pool
+        entries = await asyncio.to_thread(self._hash_many, file_list)
+        async with self._batch_async():
+            return all(self._apply_checksums(entries).values())
+
+    def dir_changed(self, root: Union[str, Path], pattern: str = "**/*") -> List[str]:
+        """
+        Find the files under a directory that have changed since the last check.
+
+        Files are compared by size and modification time from the directory scan
+        first, so only new or modified files are read and hashed.
+
+        Args:
+            root: Directory to scan recursively (absolute or relative)
+            pattern: fnmatch pattern matched against the whole path relative to
+                     root, with "/" separators. Unlike glob, "*" and "?" also
+                     match "/", so "*.py" and "**/*.py" both select Python files
+                     at any depth and "src/*" matches everything under src. A
+                     leading "**/" also matches files directly under root
+
+        Returns:
+            Cache keys of the files that are new or have changed
+        """
+        root_key = self._get_cache_key(root)
+        key_prefix = "" if root_key == "." else os.path.join(root_key, "")
+        patterns = [pattern]
+        if pattern.startswith("**/"):
+            patterns.append(pattern[3:])
+
+        # The cache file and its temporary files change with every save
+        cache_dir, cache_name = os.path.split(
+            os.path.abspath(self._normalize_path(self.cache_file))
+        )
+
+        # Only files whose stat metadata differs from the cache have to be hashed
+        stale_keys = []
+        for cache_key, st in _scan_dir(root_key, key_prefix):
+            relative_path = cache_key[len(key_prefix) :].replace(os.sep, "/")
+            if not any(fnmatch.fnmatch(relative_path, p) for p in patterns):
+                continue
+            name = os.path.basename(cache_key)
+            if (
+                name == cache_name
+                or (name.startswith(cache_name + ".") and name.endswith(".tmp"))
+            ) and os.path.dirname(os.path.abspath(cache_key)) == cache_dir:
+                continue
+            cached = self.checksums.get(cache_key)
+            if (
+                cached is None
+                or cached.size != st.st_size
+                or cached.mtime_ns != st.st_mtime_ns
+            ):
+                stale_keys.append(cache_key)
+
+        # Their stat already differs, hash them in slices on the thread pool
+        entries = self._check_many([(k, k) for k in stale_keys], use_stat=False)
+
+        with self._batch():
+            changed = self._apply_checksums(entries)
+        return sorted(cache_key for cache_key, c in changed.items() if c)
 
     def execute_if_any_changed(
         self, file_list: List[Union[str, Path]], func: Callable, *args, **kwargs
@@ -352,9 +1242,8 @@ class PyChecksumCache:
             if asyncio.iscoroutinefunction(func):
                 return await func(*args, **kwargs)
             else:
-                # Run sync function in executor
-                loop = asyncio.get_event_loop()
-                return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+                # Run sync function in a worker thread
+                return await asyncio.to_thread(func, *args, **kwargs)
         return None
 
     def refresh_cache(self, file_path: Optional[Union[str, Path]] = None) -> None:
@@ -366,21 +1255,14 @@ class PyChecksumCache:
                      or None to refresh all files in the cache
         """
         if file_path is None:
-            # Make a copy of keys to avoid modifying during iteration
-            for path in list(self.checksums.keys()):
-                try:
-                    self.checksums[path] = self.calculate_md5(path)
-                except FileNotFoundError:
-                    del self.checksums[path]
+            # Cache keys are already normalized, hash them as is
+            entries = self._check_many([(key, key) for key in self.checksums], False)
         else:
-            cache_key = self._get_cache_key(file_path)
-            try:
-                self.checksums[cache_key] = self.calculate_md5(file_path)
-            except FileNotFoundError:
-                if cache_key in self.checksums:
-                    del self.checksums[cache_key]
+            entries = self._hash_many([file_path], use_stat=False)
 
-        self._save_cache()
+        with self._batch():
+            self._apply_checksums(entries)
+            self._save_cache()
 
     async def refresh_cache_async(
         self, file_path: Optional[Union[str, Path]] = None
@@ -393,38 +1275,43 @@ class PyChecksumCache:
                      or None to refresh all files in the cache
         """
         if file_path is None:
-            # Make a copy of keys to avoid modifying during iteration
-            tasks = []
-            for path in list(self.checksums.keys()):
-                tasks.append(self._refresh_single_file_async(path))
-            await asyncio.gather(*tasks)
+            # Cache keys are already normalized, hash them as is
+            tasks = [
+                self._refresh_single_file_async(key, key)
+                for key in list(self.checksums)
+            ]
         else:
-            cache_key = self._get_cache_key(file_path)
-            try:
-                self.checksums[cache_key] = await self.calculate_md5_async(file_path)
-            except FileNotFoundError:
-                if cache_key in self.checksums:
-                    del self.checksums[cache_key]
+            tasks = [
+                self._refresh_single_file_async(
+                    self._normalize_path(file_path), self._get_cache_key(file_path)
+                )
+            ]
 
-        await self._save_cache_async()
+        async with self._batch_async():
+            await asyncio.gather(*tasks)
+            await self._save_cache_async()
 
-    async def _refresh_single_file_async(self, file_path: str) -> None:
-        """Helper method to refresh a single file asynchronously."""
-        try:
-            self.checksums[file_path] = await self.calculate_md5_async(file_path)
-        except FileNotFoundError:
-            logger.info(f"File not found: {file_path}")
-            if file_path in self.checksums:
-                del self.checksums[file_path]
+    async def _refresh_single_file_async(
+        self, path: Union[str, Path], cache_key: str
+    ) -> None:
+        """Helper method to refresh a single normalized path asynchronously."""
+        entry = await asyncio.to_thread(self._check_path, path, cache_key, False)
+        if entry is None:
+            logger.info("File not found: %s", path)
+        self._apply_checksums({cache_key: entry})
 
     def clear_cache(self) -> None:
         """Clear the entire cache."""
         self.checksums = {}
+        self._aggregates = {}
+        self._path_cache.clear()
         self._save_cache()
 
     async def clear_cache_async(self) -> None:
         """Clear the entire cache asynchronously."""
         self.checksums = {}
+        self._aggregates = {}
+        self._path_cache.clear()
         await self._save_cache_async()
 
     def remove_from_cache(self, file_path: Union[str, Path]) -> None:
@@ -451,6 +1338,333 @@ class PyChecksumCache:
             del self.checksums[cache_key]
             await self._save_cache_async()
 
+    def _detect_changes(self, input_paths: List[Path], force: bool) -> List[bool]:
+        """
+        Check which inputs of a transformation need processing, in one batch.
+
+        Args:
+            input_paths: Normalized input paths
+            force: If True, every input needs processing and nothing is hashed
+
+        Returns:
+            For each input, True if it needs processing
+        """
+        if force:
+            return [True] * len(input_paths)
+
+        with self._batch():
+            changed = self._apply_checksums(self._hash_many(input_paths))
+        return [changed[str(p)] for p in input_paths]
+
+    async def _detect_changes_async(
+        self, input_paths: List[Path], force: bool
+    ) -> List[bool]:
+        """
+        Check which inputs of a transformation need processing asynchronously.
+
+        Args:
+            input_paths: Normalized input paths
+            force: If True, every input needs processing and nothing is hashed
+
+        Returns:
+            For each input, True if it needs processing
+        """
+        if force:
+            return [True] * len(input_paths)
+
+        # Hash the whole batch in a single worker thread job on the shared pool
+        entries = await asyncio.to_thread(self._hash_many, input_paths)
+        async with self._batch_async():
+            changed = self._apply_checksums(entries)
+        return [changed[str(p)] for p in input_paths]
+
+    def _copy_and_hash(self, src: Path, dst: Path) -> bytes:
+        """
+        Copy a file like shutil.copy2 while hashing it, reading the source only once.
+
+        Args:
+            src: Path of the file to copy
+            dst: Path of the copy
+
+        Returns:
+            Digest of the copied content as bytes
+        """
+        hasher = self._new_hasher()
+        buffer, view = _read_buffer()
+
+        with open(src, "rb", buffering=0) as fsrc:
+            # Opening dst for writing would truncate the source
+            _check_not_same_file(os.fstat(fsrc.fileno()), src, dst)
+            with open(dst, "wb") as fdst:
+                while size := fsrc.readinto(buffer):
+                    hasher.update(view[:size])
+                    fdst.write(view[:size])
+        shutil.copystat(src, dst)
+
+        return hasher.digest()
+
+    def _copy_if_changed(
+        self, input_path: Path, output_file: Path, force: bool
+    ) -> Optional[CacheEntry]:
+        """
+        Copy a file to its output if it changed, hashing it during the copy.
+
+        Args:
+            input_path: Normalized input path
+            output_file: Path of the copy
+            force: If True, copy the file even if it's unchanged
+
+        Returns:
+            The up-to-date cache entry, or None if the file doesn't exist
+        """
+        try:
+            st = os.stat(input_path)
+        except FileNotFoundError:
+            if force:
+                raise
+            return None
+        if not stat.S_ISREG(st.st_mode) and not force:
+            return None
+
+        cached = self.checksums.get(str(input_path))
+        if (
+            cached is not None
+            and cached.size == st.st_size
+            and cached.mtime_ns == st.st_mtime_ns
+        ):
+            if force:
+                # The digest is already known, let the kernel copy the data
+                _fast_copy(str(input_path), str(output_file))
+            return cached
+
+        digest = self._copy_and_hash(input_path, output_file)
+        return CacheEntry(st.st_size, st.st_mtime_ns, digest)
+
+    def _fast_skip_check(
+        self,
+        input_paths: List[Path],
+        output_path: Path,
+        input_stats: Optional[List[Optional[os.stat_result]]] = None,
+    ) -> bool:
+        """
+        Check with stat calls only whether an aggregate is known to be up to date.
+
+        The aggregate is up to date when it is newer than all its inputs and every
+        input still has the size and mtime recorded in the cache. A False result
+        only means the inputs have to be checked the regular way.
+
+        Args:
+            input_paths: Normalized input paths
+            output_path: Normalized path of the aggregate file
+            input_stats: Stats already taken of the inputs, None for missing ones
+
+        Returns:
+            True if the aggregate can be skipped without hashing anything
+        """
+        output_stat = _stat_or_none(output_path)
+        if output_stat is None:
+            return False
+        if input_stats is None:
+            input_stats = [_stat_or_none(p) for p in input_paths]
+
+        for input_path, st in zip(input_paths, input_stats):
+            cached = self.checksums.get(str(input_path))
+            if (
+                st is None
+                or cached is None
+                or cached.size != st.st_size
+                or cached.mtime_ns != st.st_mtime_ns
+                or st.st_mtime_ns > output_stat.st_mtime_ns
+            ):
+                return False
+        return not self._aggregate_stale(
+            output_path, input_paths, self.checksums, output_stat
+        )
+
+    def _aggregate_stale(
+        self,
+        output_path: Path,
+        input_paths: List[Path],
+        entries: Mapping[str, Optional[CacheEntry]],
+        output_stat: Optional[os.stat_result] = None,
+        check_output: bool = True,
+    ) -> bool:
+        """
+        Check whether an aggregate must be rebuilt although no input content changed.
+
+        This is the case when it was last built from other inputs, with inputs
+        added, removed or reordered, or when the file was since removed or
+        modified. Aggregates without a record, such as ones built before they
+        were tracked, are never stale, and neither are aggregates with an input
+        that no longer exists, they couldn't be rebuilt from it.
+
+        Args:
+            output_path: Normalized path of the aggregate file
+            input_paths: Normalized input paths, in aggregation order
+            entries: Up-to-date cache entries of the inputs by cache key
+            output_stat: Stat already taken of the aggregate file
+            check_output: If False, only compare the inputs
+
+        Returns:
+            True if the record doesn't match the current inputs or aggregate file
+        """
+        previous = self.aggregates.get(str(output_path))
+        if previous is None:
+            return False
+        input_keys = [str(p) for p in input_paths]
+        if any(entries.get(cache_key) is None for cache_key in input_keys):
+            # Keep the previous aggregate until the missing input is back
+            return False
+        if previous.inputs != _inputs_digest(input_keys, entries):
+            return True
+        if not check_output or previous.size < 0:
+            return False
+
+        # The aggregate is only stat'ed, it is never read back to be hashed
+        if output_stat is None:
+            output_stat = _stat_or_none(output_path)
+        return (
+            output_stat is None
+            or output_stat.st_size != previous.size
+            or output_stat.st_mtime_ns != previous.mtime_ns
+        )
+
+    def _record_aggregate(
+        self, output_path: Path, input_paths: Optional[List[Path]]
+    ) -> None:
+        """
+        Record the inputs of an aggregate and the stat of the file they produced.
+
+        Args:
+            output_path: Normalized path of the aggregate file
+            input_paths: Normalized input paths, or None if they weren't hashed,
+                         to only refresh the stat of an existing record
+        """
+        cache_key = str(output_path)
+        previous = self.aggregates.get(cache_key)
+        input_keys = [str(p) for p in input_paths or []]
+        # The record of an aggregate kept despite a missing input stays as is
+        if input_paths is not None and all(k in self.checksums for k in input_keys):
+            inputs = _inputs_digest(input_keys, self.checksums)
+        elif previous is not None:
+            inputs = previous.inputs
+        else:
+            return
+
+        st = _stat_or_none(output_path)
+        aggregate = AggregateEntry(
+            inputs,
+            st.st_size if st is not None else -1,
+            st.st_mtime_ns if st is not None else -1,
+        )
+        if aggregate != previous:
+            self.aggregates[cache_key] = aggregate
+            self._save_cache()
+
+    def _aggregate_if_changed(
+        self, input_paths: List[Path], output_path: Path, force: bool
+    ) -> bool:
+        """
+        Run the default aggregation if an input changed, hashing inputs while copying.
+
+        Inputs whose stat metadata matches the cache are copied without hashing,
+        the others are hashed from the same read that copies them.
+
+        Args:
+            input_paths: Normalized input paths
+            output_path: Normalized path of the aggregate file
+            force: If True, write the aggregate even if no input changed
+
+        Returns:
+            True if an input is new or its content has changed, or if forced
+        """
+        # A single stat per input serves both the fast check and the cache lookup
+        input_stats = [_stat_or_none(p) for p in input_paths]
+        if not force and self._fast_skip_check(input_paths, output_path, input_stats):
+            return False
+
+        entries: Dict[str, Optional[CacheEntry]] = {}
+        hashers = {}
+        for input_path, st in zip(input_paths, input_stats):
+            cache_key = str(input_path)
+            if st is None or not stat.S_ISREG(st.st_mode):
+                entries[cache_key] = None
+                continue
+
+            cached = self.checksums.get(cache_key)
+            if (
+                cached is not None
+                and cached.size == st.st_size
+                and cached.mtime_ns == st.st_mtime_ns
+            ):
+                entries[cache_key] = cached
+            else:
+                hashers[cache_key] = self._new_hasher()
+
+        # With nothing to hash every entry is known, compare with the record
+        stale = not hashers and self._aggregate_stale(output_path, input_paths, entries)
+        if hashers or force or stale:
+            stats = _default_aggregate(
+                [str(p) for p in input_paths], str(output_path), hashers
+            )
+            for cache_key, hasher in hashers.items():
+                st = stats[cache_key]
+                entries[cache_key] = CacheEntry(
+                    st.st_size, st.st_mtime_ns, hasher.digest()
+                )
+
+        # The aggregate was just written, only the inputs can be compared now
+        stale = stale or self._aggregate_stale(
+            output_path, input_paths, entries, check_output=False
+        )
+        with self._batch():
+            changed = self._apply_checksums(entries)
+            self._record_aggregate(output_path, input_paths)
+        return force or stale or any(changed.values())
+
+    def _copy_many(
+        self, input_paths: List[Path], output_files: List[Path], force: bool
+    ) -> List[bool]:
+        """
+        Copy the changed files in parallel, updating their checksums in the same pass.
+
+        Args:
+            input_paths: Normalized input paths
+            output_files: Output path of each input
+            force: If True, copy all files regardless of whether they've changed
+
+        Returns:
+            For each input, True if it has been processed
+        """
+        futures = [
+            _HASH_EXECUTOR.submit(self._copy_if_changed, input_path, output_file, force)
+            for input_path, output_file in zip(input_paths, output_files)
+        ]
+        entries = {str(p): future.result() for p, future in zip(input_paths, futures)}
+
+        with self._batch():
+            changed = self._apply_checksums(entries)
+        return [force or changed[str(p)] for p in input_paths]
+
+    @staticmethod
+    def _output_name_func(output_extension: str) -> Callable[[Path], str]:
+        """
+        Get the function generating output filenames, resolved once per call.
+
+        Args:
+            output_extension: Optional extension to add/replace for output files
+
+        Returns:
+            A function mapping an input path to its output filename
+        """
+        if not output_extension:
+            return lambda input_path: input_path.name
+        if output_extension.startswith("."):
+            # Replace extension
+            return lambda input_path: input_path.stem + output_extension
+        # Append to existing name
+        return lambda input_path: input_path.name + output_extension
+
     def transform(
         self,
         input_files: List[Union[str, Path]],
@@ -480,15 +1694,7 @@ class PyChecksumCache:
         """
         results = []
 
-        # Check if any files have changed
-        changed_files = []
-        unchanged_files = []
-
-        for input_file in input_files:
-            if force or self.has_changed(input_file):
-                changed_files.append(self._normalize_path(input_file))
-            else:
-                unchanged_files.append(self._normalize_path(input_file))
+        input_paths = [self._normalize_path(f) for f in input_files]
 
         # Handle aggregate output if specified
         if aggregate_output_file:
@@ -497,29 +1703,31 @@ class PyChecksumCache:
             # Create the parent directory if it doesn't exist
             output_path.parent.mkdir(parents=True, exist_ok=True)
 
-            # Only process if there are changed files or we're forcing
-            was_transformed = bool(changed_files) or force
-
-            if was_transformed:
-                # Use default function if none provided
-                if transform_func_aggregate is None:
-
-                    def default_transform_aggregate(input_paths, output_path):
-                        with open(output_path, "w") as outfile:
-                            for input_path in input_paths:
-                                with open(input_path, "r") as infile:
-                                    outfile.write(
-                                        f"--- {os.path.basename(input_path)} ---\n"
-                                    )
-                                    outfile.write(infile.read())
-                                    outfile.write("\n\n")
-
-                    transform_func_aggregate = default_transform_aggregate
-
-                # Apply the transformation
-                transform_func_aggregate(
-                    [str(f) for f in input_files], str(output_path)
+            if transform_func_aggregate is None:
+                # Default aggregation, hashing the changed inputs while copying them
+                was_transformed = self._aggregate_if_changed(
+                    input_paths, output_path, force
                 )
+            elif not force and self._fast_skip_check(input_paths, output_path):
+                was_transformed = False
+            else:
+                with self._batch():
+                    # Only process if there are changed files or we're forcing
+                    was_transformed = force or any(
+                        self._detect_changes(input_paths, force)
+                    )
+                    # Also rebuild if the inputs were relisted or the output changed
+                    was_transformed = was_transformed or self._aggregate_stale(
+                        output_path, input_paths, self.checksums
+                    )
+
+                    if was_transformed:
+                        # Apply the transformation
+                        transform_func_aggregate(
+                            [str(f) for f in input_files], str(output_path)
+                        )
+                    # Forced runs don't hash, the cached digests may be outdated
+                    self._record_aggregate(output_path, None if force else input_paths)
 
             results.append((output_path, was_transformed))
 
@@ -528,34 +1736,24 @@ class PyChecksumCache:
             output_path = self._normalize_path(output_folder)
             output_path.mkdir(parents=True, exist_ok=True)
 
-            # Default transformation function (copy file) if none provided
-            if transform_func is None:
-                transform_func = shutil.copy2
-
-            for input_file in input_files:
-                input_path = self._normalize_path(input_file)
-
-                # Generate output filename
-                if output_extension:
-                    if output_extension.startswith("."):
-                        # Replace extension
-                        output_filename = input_path.stem + output_extension
-                    else:
-                        # Append to existing name
-                        output_filename = input_path.name + output_extension
-                else:
-                    output_filename = input_path.name
-
-                output_file = output_path / output_filename
+            output_name = self._output_name_func(output_extension)
+            output_files = [output_path / output_name(p) for p in input_paths]
 
-                # Check if this file changed
-                needs_processing = input_path in changed_files or force
+            if transform_func is None:
+                # Default transformation (copy file), hashing while copying
+                needs_processing = self._copy_many(input_paths, output_files, force)
+            else:
+                # Check if these files changed
+                needs_processing = self._detect_changes(input_paths, force)
 
-                if needs_processing:
-                    # Perform the transformation
-                    transform_func(str(input_path), str(output_file))
+                for input_path, output_file, needs in zip(
+                    input_paths, output_files, needs_processing
+                ):
+                    if needs:
+                        # Perform the transformation
+                        transform_func(str(input_path), str(output_file))
 
-                results.append((output_file, needs_processing))
+            results.extend(zip(output_files, needs_processing))
 
         else:
             raise ValueError(
@@ -594,20 +1792,7 @@ class PyChecksumCache:
             List of tuples containing (output_path, was_transformed)
         """
 
-        # Check if any files have changed asynchronously
-        async def check_file(file_path):
-            file_path = self._normalize_path(file_path)
-            if force or await self.has_changed_async(file_path):
-                return (file_path, True)
-            return (file_path, False)
-
-        # Create tasks for all files to check changes
-        change_tasks = [check_file(file_path) for file_path in input_files]
-        check_results = await asyncio.gather(*change_tasks)
-
-        # Separate changed and unchanged files
-        changed_files = [path for path, changed in check_results if changed]
-        # unchanged_files = [path for path, changed in check_results if not changed]
+        input_paths = [self._normalize_path(f) for f in input_files]
 
         results = []
 
@@ -618,40 +1803,42 @@ class PyChecksumCache:
             # Create the parent directory if it doesn't exist
             output_path.parent.mkdir(parents=True, exist_ok=True)
 
-            # Only process if there are changed files or we're forcing
-            was_transformed = bool(changed_files) or force
-
-            if was_transformed:
-                # Use default function if none provided
-                if transform_func_aggregate is None:
-
-                    async def default_transform_aggregate(input_paths, output_path):
-                        with open(output_path, "w") as outfile:
-                            for input_path in input_paths:
-                                with open(input_path, "r") as infile:
-                                    outfile.write(
-                                        f"--- {os.path.basename(input_path)} ---\n"
-                                    )
-                                    outfile.write(infile.read())
-                                    outfile.write("\n\n")
-
-                    transform_func_aggregate = default_transform_aggregate
-
-                # Apply the transformation
-                if asyncio.iscoroutinefunction(transform_func_aggregate):
-                    await transform_func_aggregate(
-                        [str(f) for f in input_files], str(output_path)
+            if transform_func_aggregate is None:
+                # Default aggregation, hashing the changed inputs while copying them
+                was_transformed = await asyncio.to_thread(
+                    self._aggregate_if_changed, input_paths, output_path, force
+                )
+            elif not force and await asyncio.to_thread(
+                self._fast_skip_check, input_paths, output_path
+            ):
+                was_transformed = False
+            else:
+                async with self._batch_async():
+                    # Only process if there are changed files or we're forcing
+                    was_transformed = force or any(
+                        await self._detect_changes_async(input_paths, force)
                     )
-                else:
-                    # Run sync function in executor
-                    loop = asyncio.get_event_loop()
-                    await loop.run_in_executor(
-                        None,
-                        lambda: transform_func_aggregate(
-                            [str(f) for f in input_files], str(output_path)
-                        ),
+                    # Also rebuild if the inputs were relisted or the output changed
+                    was_transformed = was_transformed or self._aggregate_stale(
+                        output_path, input_paths, self.checksums
                     )
 
+                    if was_transformed:
+                        # Apply the transformation
+                        if asyncio.iscoroutinefunction(transform_func_aggregate):
+                            await transform_func_aggregate(
+                                [str(f) for f in input_files], str(output_path)
+                            )
+                        else:
+                            # Run sync function in a worker thread
+                            await asyncio.to_thread(
+                                transform_func_aggregate,
+                                [str(f) for f in input_files],
+                                str(output_path),
+                            )
+                    # Forced runs don't hash, the cached digests may be outdated
+                    self._record_aggregate(output_path, None if force else input_paths)
+
             results.append((output_path, was_transformed))
 
         # Handle individual file transformations if output_folder is specified
@@ -659,57 +1846,46 @@ class PyChecksumCache:
             output_path = self._normalize_path(output_folder)
             output_path.mkdir(parents=True, exist_ok=True)
 
-            # Default transformation function (copy file) if none provided
-            if transform_func is None:
-                transform_func = shutil.copy2
-
-            # Create a semaphore to limit concurrency
-            semaphore = asyncio.Semaphore(concurrency_limit)
-
-            # Process files with concurrency limit
-            async def process_file(input_file):
-                input_path = self._normalize_path(input_file)
-
-                # Generate output filename
-                if output_extension:
-                    if output_extension.startswith("."):
-                        # Replace extension
-                        output_filename = input_path.stem + output_extension
-                    else:
-                        # Append to existing name
-                        output_filename = input_path.name + output_extension
-                else:
-                    output_filename = input_path.name
+            output_name = self._output_name_func(output_extension)
+            output_files = [output_path / output_name(p) for p in input_paths]
 
-                output_file = output_path / output_filename
+            if transform_func is None:
+                # Default transformation (copy file), hashing while copying
+                needs_processing = await asyncio.to_thread(
+                    self._copy_many, input_paths, output_files, force
+                )
+                pending = []
+            else:
+                # Check if these files changed
+                needs_processing = await self._detect_changes_async(input_paths, force)
+                pending = [
+                    (str(input_path), str(output_file))
+                    for input_path, output_file, needs in zip(
+                        input_paths, output_files, needs_processing
+                    )
+                    if needs
+                ]
 
-                # Check if this file changed
-                needs_processing = input_path in changed_files or force
+            if asyncio.iscoroutinefunction(transform_func):
+                # Create a semaphore to limit concurrency
+                semaphore = asyncio.Semaphore(concurrency_limit)
 
-                if needs_processing:
-                    # Acquire semaphore to limit concurrency
+                async def process_file(input_file, output_file):
                     async with semaphore:
-                        # Perform the transformation
-                        if asyncio.iscoroutinefunction(transform_func):
-                            await transform_func(str(input_path), str(output_file))
-                        else:
-                            # Run synchronous function in executor
-                            loop = asyncio.get_event_loop()
-                            await loop.run_in_executor(
-                                None,
-                                lambda: transform_func(
-                                    str(input_path), str(output_file)
-                                ),
-                            )
+                        await transform_func(input_file, output_file)
 
-                return (output_file, needs_processing)
+                await asyncio.gather(*[process_file(i, o) for i, o in pending])
+            elif transform_func is not None and pending:
+                # Run synchronous transformations as a single worker thread job,
+                # spread over a pool bounded by the concurrency limit
+                def process_batch():
+                    with ThreadPoolExecutor(max_workers=concurrency_limit) as pool:
+                        # Consume the results so exceptions are raised
+                        list(pool.map(transform_func, *zip(*pending)))
 
-            # Create tasks for all files
-            tasks = [process_file(input_file) for input_file in input_files]
+                await asyncio.to_thread(process_batch)
 
-            # Wait for all tasks to complete
-            file_results = await asyncio.gather(*tasks)
-            results.extend(file_results)
+            results.extend(zip(output_files, needs_processing))
 
         else:
             raise ValueError(
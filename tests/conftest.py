@@ -1,3 +1,5 @@
+import shutil
+
 import pytest
 
 
@@ -18,3 +20,9 @@ pytest_plugins = ["pytester"]
 def disable_logging_exception(mocker):
     if not SHOW_EXCEPTIONS:
         mocker.patch("logging.exception", lambda *args, **kwargs: None)
+
+
+@pytest.fixture
+def default_cache(tmp_path):
+    # Copy of the tracked cache, so checking it never rewrites the fixture
+    return shutil.copyfile("checksum_cache.json", tmp_path / "checksum_cache.json")
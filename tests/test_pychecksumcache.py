@@ -1,8 +1,13 @@
 import pytest
+import hashlib
 import logging
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 from pychecksumcache import PyChecksumCache
+from pychecksumcache import pychecksumcache
+from pychecksumcache.pychecksumcache import _SHARED_STATES_SIZE
 
 # For console output
 handler = logging.StreamHandler()
@@ -16,7 +21,7 @@ output_extension = ".generated.txt"
 
 
 @pytest.mark.asyncio
-async def test_pychecksumcache_skipped():
+async def test_pychecksumcache_skipped(default_cache):
     # Define a transformation function
     def transform_func(input_path, output_path):
         with open(input_path, "r") as infile, open(output_path, "w") as outfile:
@@ -26,14 +31,14 @@ async def test_pychecksumcache_skipped():
             outfile.write(transformed)
 
     # Perform the transformation
-    results = PyChecksumCache().transform(
+    results = PyChecksumCache(default_cache).transform(
         input_files, output_folder, output_extension, transform_func
     )
 
     # See which files were processed
     for output_file, was_transformed in results:
         assert not was_transformed, f"Skipped (unchanged): {output_file}"
-    assert os.path.exists("checksum_cache.json") is True
+    assert os.path.exists(default_cache) is True
 
 
 @pytest.mark.asyncio
@@ -58,3 +63,319 @@ async def test_pychecksumcache_transformed():
         assert was_transformed, f"Transformed: {output_file}"
 
     assert os.path.exists(".cache/checksum_cache_transformed.json") is True
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_algorithm_change_invalidates_cache():
+    cache_file = ".cache/checksum_cache_algorithm.json"
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+    assert PyChecksumCache(cache_file).all_changed(input_files)
+    assert not PyChecksumCache(cache_file).any_changed(input_files)
+
+    # Digests stored with MD5 can't be compared against SHA-256 ones
+    cache = PyChecksumCache(cache_file, algorithm="sha256")
+    assert cache.all_changed(input_files)
+    assert len(cache.calculate_md5(input_files[0])) == 64
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_xxh3_64():
+    pytest.importorskip("xxhash")
+    cache_file = ".cache/checksum_cache_xxh3.json"
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+    cache = PyChecksumCache(cache_file, algorithm="xxh3_64")
+    assert cache.all_changed(input_files)
+    assert len(cache.calculate_md5(input_files[0])) == 16
+    assert not PyChecksumCache(cache_file, algorithm="xxh3_64").any_changed(input_files)
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="requires FIFOs")
+async def test_pychecksumcache_not_regular_file(tmp_path):
+    fifo = tmp_path / "fifo"
+    os.mkfifo(fifo)
+
+    # Only regular files are hashed, a FIFO or a device would never end
+    cache = PyChecksumCache(tmp_path / "checksum_cache.json")
+    for path in (fifo, os.devnull, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            cache.calculate_md5(path)
+        with pytest.raises(FileNotFoundError):
+            await cache.calculate_md5_async(path)
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_any_changed_records_all_files():
+    cache_file = ".cache/checksum_cache_any_changed.json"
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+    cache = PyChecksumCache(cache_file)
+    assert cache.any_changed(input_files)
+    # Every file is hashed in the batch, not only up to the first change
+    assert all(cache.checksums.get(f) for f in input_files)
+    assert not cache.any_changed(input_files)
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_batch_saves_once(mocker):
+    cache_file = ".cache/checksum_cache_batch.json"
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+    cache = PyChecksumCache(cache_file)
+    write_cache = mocker.spy(cache, "_write_cache")
+    assert await cache.any_changed_async(input_files)
+    assert write_cache.call_count == 1
+
+    # Checks left once a change is found are cancelled, use a file that completed
+    checked_file = next(iter(cache.checksums))
+    cache.remove_from_cache(checked_file)
+    assert write_cache.call_count == 2
+    with cache._batch():
+        assert cache.has_changed(checked_file)
+        assert write_cache.call_count == 2
+    assert write_cache.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_shared_state_skips_parsing(mocker):
+    cache_file = ".cache/checksum_cache_shared.json"
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+    PyChecksumCache(cache_file).all_changed(input_files)
+
+    # The cache written in this process is reused, not parsed again
+    loads = mocker.spy(PyChecksumCache, "_loads")
+    cache = PyChecksumCache(cache_file)
+    assert loads.call_count == 0
+    assert not cache.any_changed(input_files)
+
+    # A cache file changed behind our back is parsed again
+    with open(cache_file, "w") as f:
+        f.write('{"algorithm":"md5","checksums":{},"version":2}')
+    assert PyChecksumCache(cache_file).checksums == {}
+    assert loads.call_count == 1
+
+    # A layout newer than this version understands isn't misread
+    with open(cache_file, "w") as f:
+        f.write('{"algorithm":"md5","checksums":{"tests/file1.txt":"00"},"version":99}')
+    assert PyChecksumCache(cache_file).checksums == {}
+
+    # Only the most recently used cache files are kept in memory
+    for i in range(_SHARED_STATES_SIZE + 1):
+        PyChecksumCache(f".cache/checksum_cache_shared_{i}.json").all_changed(
+            input_files
+        )
+    assert len(PyChecksumCache._shared_states) == _SHARED_STATES_SIZE
+    assert os.path.abspath(cache_file) not in PyChecksumCache._shared_states
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_concurrent_writers():
+    cache_file = ".cache/concurrent/checksum_cache.json"
+    shutil.rmtree(".cache/concurrent", ignore_errors=True)
+
+    # Writers of the same cache file each use their own temporary file
+    caches = [PyChecksumCache(cache_file) for _ in range(8)]
+    with ThreadPoolExecutor(max_workers=len(caches)) as pool:
+        list(pool.map(lambda cache: cache.all_changed(input_files), caches))
+    assert os.listdir(".cache/concurrent") == ["checksum_cache.json"]
+    assert not PyChecksumCache(cache_file).any_changed(input_files)
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(os.name != "posix", reason="requires POSIX file modes")
+async def test_pychecksumcache_cache_file_mode(tmp_path):
+    cache_file = tmp_path / "checksum_cache.json"
+
+    # A new cache file honors the umask, an existing one keeps its mode
+    umask = os.umask(0o077)
+    try:
+        PyChecksumCache(cache_file).all_changed(input_files)
+    finally:
+        os.umask(umask)
+    assert cache_file.stat().st_mode & 0o777 == 0o600
+
+    cache_file.chmod(0o640)
+    PyChecksumCache(cache_file).remove_from_cache(input_files[0])
+    assert cache_file.stat().st_mode & 0o777 == 0o640
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_medium_file_single_hasher(mocker, tmp_path):
+    input_file = tmp_path / "medium.bin"
+    input_file.write_bytes(os.urandom(256 * 1024))
+
+    # Files read in chunks go through the thread's buffer with a single hasher
+    cache = PyChecksumCache(tmp_path / "checksum_cache.json")
+    new_hasher = mocker.spy(cache, "_new_hasher")
+    digest = cache.calculate_md5(input_file)
+    assert new_hasher.call_count == 1
+    assert digest == hashlib.md5(input_file.read_bytes()).hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_short_reads(mocker):
+    cache_file = ".cache/checksum_cache_short_reads.json"
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+    cache = PyChecksumCache(cache_file)
+    digest = cache.calculate_md5(input_files[0])
+
+    # Reads may return fewer bytes than requested, the whole file is still hashed
+    read = os.read
+    mocker.patch.object(
+        pychecksumcache.os, "read", side_effect=lambda fd, n: read(fd, min(n, 3))
+    )
+    assert cache.calculate_md5(input_files[0]) == digest
+
+    aggregate_file = "tests/output/short_reads_aggregated.txt"
+    cache.transform(input_files=input_files, aggregate_output_file=aggregate_file)
+    with open(aggregate_file, "rb") as f, open(input_files[0], "rb") as infile:
+        assert infile.read() in f.read()
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_lazy_load(mocker):
+    cache_file = ".cache/checksum_cache_lazy.json"
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+    PyChecksumCache(cache_file).all_changed(input_files)
+
+    # Hashing alone never reads the cache file
+    cache = PyChecksumCache(cache_file)
+    load_cache = mocker.spy(cache, "_load_cache")
+    cache.calculate_md5(input_files[0])
+    assert load_cache.call_count == 0
+
+    assert not cache.any_changed(input_files)
+    assert load_cache.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_unchanged_stat_skips_hashing(mocker):
+    cache_file = ".cache/checksum_cache_stat.json"
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+    assert PyChecksumCache(cache_file).all_changed(input_files)
+
+    # Size and mtime still match the cached entries, nothing has to be read
+    cache = PyChecksumCache(cache_file)
+    file_digest = mocker.spy(cache, "_file_digest_raw")
+    assert not cache.any_changed(input_files)
+    assert not await cache.has_changed_async(input_files[0])
+    assert file_digest.call_count == 0
+
+    # A touched file is rehashed but its content is still unchanged
+    stat = os.stat(input_files[0])
+    os.utime(input_files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    try:
+        assert not cache.has_changed(input_files[0])
+        assert file_digest.call_count == 1
+    finally:
+        os.utime(input_files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_legacy_cache_upgraded(mocker, default_cache):
+    # Digest-only entries are rehashed once, the upgraded cache is saved
+    assert not PyChecksumCache(default_cache).any_changed(input_files)
+
+    cache = PyChecksumCache(default_cache)
+    file_digest = mocker.spy(cache, "_file_digest_raw")
+    assert not cache.any_changed(input_files)
+    assert file_digest.call_count == 0
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_transform_async_sync_function():
+    def transform_func(input_path, output_path):
+        with open(input_path, "r") as infile, open(output_path, "w") as outfile:
+            outfile.write(infile.read().upper())
+
+    cache_file = ".cache/checksum_cache_transform_async.json"
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+    cache = PyChecksumCache(cache_file)
+    results = await cache.transform_async(
+        input_files, output_folder, ".async.txt", transform_func, concurrency_limit=2
+    )
+    assert [was_transformed for _, was_transformed in results] == [True, True]
+    for output_file, _ in results:
+        assert os.path.exists(output_file)
+
+    results = await cache.transform_async(
+        input_files, output_folder, ".async.txt", transform_func
+    )
+    assert [was_transformed for _, was_transformed in results] == [False, False]
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_default_copy():
+    cache_file = ".cache/checksum_cache_default_copy.json"
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+    cache = PyChecksumCache(cache_file)
+    results = cache.transform(input_files, output_folder, ".copy.txt")
+    assert [was_transformed for _, was_transformed in results] == [True, True]
+    for input_file, (output_file, _) in zip(input_files, results):
+        with open(input_file, "rb") as infile, open(output_file, "rb") as outfile:
+            assert infile.read() == outfile.read()
+    # Digests were computed while copying
+    assert not PyChecksumCache(cache_file).any_changed(input_files)
+
+    results = await cache.transform_async(input_files, output_folder, ".copy.txt")
+    assert [was_transformed for _, was_transformed in results] == [False, False]
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_default_copy_same_file(tmp_path):
+    input_file = tmp_path / "a.txt"
+    input_file.write_bytes(b"content")
+
+    # Copying a file onto itself must not truncate it, cached or not
+    cache = PyChecksumCache(tmp_path / "checksum_cache.json")
+    with pytest.raises(shutil.SameFileError):
+        cache.transform([input_file], tmp_path)
+    cache.all_changed([input_file])
+    with pytest.raises(shutil.SameFileError):
+        cache.transform([input_file], tmp_path, force=True)
+
+    with open(input_file, "rb") as f:
+        assert f.read() == b"content"
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_dir_changed(mocker, tmp_path):
+    cache_file = ".cache/checksum_cache_dir_changed.json"
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+    cache = PyChecksumCache(cache_file)
+    check_many = mocker.spy(cache, "_check_many")
+    assert cache.dir_changed("tests", "file*.txt") == input_files
+    assert check_many.call_count == 1
+    assert cache.dir_changed("tests", "file*.txt") == []
+    assert not PyChecksumCache(cache_file).any_changed(input_files)
+
+    # Like fnmatch, "*" also matches "/" and selects files in subdirectories
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "file.txt").write_bytes(b"nested")
+    assert cache.dir_changed(tmp_path, "*.txt") == [str(tmp_path / "sub" / "file.txt")]
+
+    # The cache file and its temporary files are never reported
+    cache = PyChecksumCache(tmp_path / "checksum_cache.json")
+    (tmp_path / "checksum_cache.json.abc123.tmp").write_bytes(b"partial")
+    assert cache.dir_changed(tmp_path) == [str(tmp_path / "sub" / "file.txt")]
+    (tmp_path / "sub" / "file.txt").write_bytes(b"edited")
+    assert cache.dir_changed(tmp_path) == [str(tmp_path / "sub" / "file.txt")]
+    assert cache.dir_changed(tmp_path) == []
@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 import logging
 import os
@@ -15,24 +16,26 @@ output_folder = "tests/output"
 output_extension = ".generated.txt"
 aggregate_output_file = "tests/output/aggregated.txt"
 
+# Upper-cases ASCII letters in bytes without decoding them
+_UPPER = bytes.maketrans(b"abcdefghijklmnopqrstuvwxyz", b"ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+
 
 @pytest.mark.asyncio
-async def test_pychecksumcache_aggregate_skipped():
+async def test_pychecksumcache_aggregate_skipped(default_cache):
     # Define an aggregate transformation function
     def transform_func_aggregate(input_paths, output_path):
-        with open(output_path, "w") as outfile:
+        with open(output_path, "wb") as outfile:
             for input_path in input_paths:
-                with open(input_path, "r") as infile:
+                with open(input_path, "rb") as infile:
                     content = infile.read()
                     # Transform each file
-                    transformed = content.upper()
-                    outfile.write(f"FILE: {os.path.basename(input_path)}\n")
-                    outfile.write(transformed)
-                    outfile.write("\n---\n")
+                    transformed = content.translate(_UPPER)
+                    name = os.path.basename(input_path).encode()
+                    outfile.write(b"FILE: %s\n%s\n---\n" % (name, transformed))
 
     # Ensure the cache file exists from previous tests
     # This should cause the files to be skipped since they haven't changed
-    results = PyChecksumCache().transform(
+    results = PyChecksumCache(default_cache).transform(
         input_files=input_files,
         aggregate_output_file=aggregate_output_file,
         transform_func_aggregate=transform_func_aggregate,
@@ -48,15 +51,14 @@ async def test_pychecksumcache_aggregate_skipped():
 async def test_pychecksumcache_aggregate_transformed():
     # Define an aggregate transformation function
     def transform_func_aggregate(input_paths, output_path):
-        with open(output_path, "w") as outfile:
+        with open(output_path, "wb") as outfile:
             for input_path in input_paths:
-                with open(input_path, "r") as infile:
+                with open(input_path, "rb") as infile:
                     content = infile.read()
                     # Transform each file
-                    transformed = content.upper()
-                    outfile.write(f"FILE: {os.path.basename(input_path)}\n")
-                    outfile.write(transformed)
-                    outfile.write("\n---\n")
+                    transformed = content.translate(_UPPER)
+                    name = os.path.basename(input_path).encode()
+                    outfile.write(b"FILE: %s\n%s\n---\n" % (name, transformed))
 
     # Create a new cache file to ensure transformation happens
     cache_file = ".cache/checksum_cache_aggregate.json"
@@ -127,16 +129,25 @@ async def test_pychecksumcache_async_aggregate():
     """Test the async version of the aggregate transformation."""
 
     # Define an async aggregate transformation function
+    def read_file(input_path):
+        with open(input_path, "rb") as infile:
+            return os.path.basename(input_path), infile.read()
+
+    def write_chunks(output_path, chunks):
+        with open(output_path, "wb") as outfile:
+            for name, content in chunks:
+                # Transform each file
+                outfile.write(
+                    b"ASYNC FILE: %s\n%s\n---\n"
+                    % (name.encode(), content.translate(_UPPER))
+                )
+
     async def transform_func_aggregate_async(input_paths, output_path):
-        with open(output_path, "w") as outfile:
-            for input_path in input_paths:
-                with open(input_path, "r") as infile:
-                    content = infile.read()
-                    # Transform each file
-                    transformed = content.upper()
-                    outfile.write(f"ASYNC FILE: {os.path.basename(input_path)}\n")
-                    outfile.write(transformed)
-                    outfile.write("\n---\n")
+        # Read all the files concurrently, then write the output once
+        chunks = await asyncio.gather(
+            *(asyncio.to_thread(read_file, p) for p in input_paths)
+        )
+        await asyncio.to_thread(write_chunks, output_path, chunks)
 
     # Create a new cache file to ensure transformation happens
     cache_file = ".cache/checksum_cache_async_aggregate.json"
@@ -172,3 +183,125 @@ async def test_pychecksumcache_async_aggregate():
         assert "ASYNC FILE: file2.txt" in content, (
             "Second file not included in async aggregate output"
         )
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_aggregate_unchanged_stat_skips_hashing(mocker):
+    cache_file = ".cache/checksum_cache_aggregate_stat.json"
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+    aggregate_file = "tests/output/stat_aggregated.txt"
+    PyChecksumCache(cache_file).transform(
+        input_files=input_files, aggregate_output_file=aggregate_file
+    )
+
+    # Deciding to skip the aggregate only takes a stat of each input
+    cache = PyChecksumCache(cache_file)
+    file_digest = mocker.spy(cache, "_file_digest_raw")
+    results = await cache.transform_async(
+        input_files=input_files, aggregate_output_file=aggregate_file
+    )
+    assert results == [(cache._normalize_path(aggregate_file), False)]
+    assert file_digest.call_count == 0
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_aggregate_inputs_relisted():
+    cache_file = ".cache/checksum_cache_aggregate_relisted.json"
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+    aggregate_file = "tests/output/relisted_aggregated.txt"
+    cache = PyChecksumCache(cache_file)
+    assert cache.transform(
+        input_files=input_files, aggregate_output_file=aggregate_file
+    )[0][1]
+
+    # Same contents, but the aggregate was built from the inputs in another order
+    reordered = input_files[::-1]
+    cache = PyChecksumCache(cache_file)
+    assert cache.transform(input_files=reordered, aggregate_output_file=aggregate_file)[
+        0
+    ][1]
+    assert not cache.transform(
+        input_files=reordered, aggregate_output_file=aggregate_file
+    )[0][1]
+
+    # Dropping an input is caught with a custom aggregate function too
+    results = await PyChecksumCache(cache_file).transform_async(
+        input_files=input_files[:1],
+        aggregate_output_file=aggregate_file,
+        transform_func_aggregate=lambda inputs, output: None,
+    )
+    assert results[0][1]
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_aggregate_output_modified():
+    cache_file = ".cache/checksum_cache_aggregate_output.json"
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+
+    aggregate_file = "tests/output/output_aggregated.txt"
+    cache = PyChecksumCache(cache_file)
+    assert cache.transform(
+        input_files=input_files, aggregate_output_file=aggregate_file
+    )[0][1]
+    with open(aggregate_file, "rb") as f:
+        content = f.read()
+
+    # An edited or removed aggregate is rebuilt even though no input changed
+    with open(aggregate_file, "ab") as f:
+        f.write(b"edited")
+    cache = PyChecksumCache(cache_file)
+    assert cache.transform(
+        input_files=input_files, aggregate_output_file=aggregate_file
+    )[0][1]
+    os.remove(aggregate_file)
+    assert cache.transform(
+        input_files=input_files, aggregate_output_file=aggregate_file
+    )[0][1]
+    assert not cache.transform(
+        input_files=input_files, aggregate_output_file=aggregate_file
+    )[0][1]
+
+    with open(aggregate_file, "rb") as f:
+        assert f.read() == content
+
+
+@pytest.mark.asyncio
+async def test_pychecksumcache_aggregate_input_vanished(tmp_path):
+    cache_file = tmp_path / "checksum_cache.json"
+    vanished_inputs = [input_files[0], str(tmp_path / "file.txt")]
+    with open(vanished_inputs[1], "wb") as f:
+        f.write(b"vanished")
+
+    aggregate_file = tmp_path / "aggregated.txt"
+    cache = PyChecksumCache(cache_file)
+    assert cache.transform(
+        input_files=vanished_inputs, aggregate_output_file=aggregate_file
+    )[0][1]
+    with open(aggregate_file, "rb") as f:
+        content = f.read()
+
+    # A deleted input doesn't trigger a rebuild that would fail to read it
+    os.remove(vanished_inputs[1])
+    assert not cache.transform(
+        input_files=vanished_inputs, aggregate_output_file=aggregate_file
+    )[0][1]
+    results = await PyChecksumCache(cache_file).transform_async(
+        input_files=vanished_inputs,
+        aggregate_output_file=aggregate_file,
+        transform_func_aggregate=lambda inputs, output: pytest.fail("rebuilt"),
+    )
+    assert not results[0][1]
+    with open(aggregate_file, "rb") as f:
+        assert f.read() == content
+
+    # The aggregate is rebuilt once the input is back
+    with open(vanished_inputs[1], "wb") as f:
+        f.write(b"vanished")
+    assert cache.transform(
+        input_files=vanished_inputs, aggregate_output_file=aggregate_file
+    )[0][1]